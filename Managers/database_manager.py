@@ -8,10 +8,26 @@ Use the factory to obtain a manager for a specific domain.
     ### CONNECTION OPERATIONS ###
     def close(self):
 
+    ### MAINTENANCE ###
+    def backup_to(self, path, pages_per_step=64, sleep=0.05, progress=None):
+    def set_auto_vacuum(self, mode="INCREMENTAL"):
+    def incremental_vacuum(self, max_pages=0):
+
+    ### IN-MEMORY TABLES ###
+    def pin_in_memory(self, *tables):
+    def unpin(self, *tables):
+    def resync(self, *tables):
+
     ### CREATE ###
     def create_tables(self):
     def add_table(self, entity):
     def create_view(self, view_name, select_obj):
+    def create_materialized_view(self, view_name, select_obj, key, sources=None):
+    def refresh(self, view_name):
+
+    ### FULL-TEXT SEARCH ###
+    def rebuild_fulltext(self, tablename):
+    def search(self, tablename, query, limit=None, rank=True):
 
     ### USER OPERATIONS ###
     def create_user(self, user_name):
@@ -28,11 +44,20 @@ Use the factory to obtain a manager for a specific domain.
     ### UPDATE ###
     def update(self, Obj):
 
+    ### WRITE-BEHIND ###
+    def enable_write_behind(self, batch_size=100, max_delay=0.05, max_queue=1000):
+    def disable_write_behind(self):
+
+    ### BLOB ###
+    def open_blob(self, tablename, column, pk, mode="r"):
+
     ### SELECT ###
     def exists(self, tablename, **kargs): # helper
     def select_from(self, tables_obj, cols_obj="*", *args):
     def select_all_from(self, tables_obj, *args):
     def count(self, tables_obj, *args):
+    def load_deferred(self, objects, *cols):
+    def aggregate(self, tables_obj, *args, group_by=None, sum=None, avg=None, min=None, max=None, count=None, having=None):
 
     ### DROP / DELETE ### 
     def drop_table(self, tablename):
@@ -44,12 +69,17 @@ Use the factory to obtain a manager for a specific domain.
     ### ALTER ###
     def add_column(self, tablename, col_name, col_type):
     def add_columns(self, tablename, **columns): # helper
-    def drop_column(self, tablename, column):
+    def drop_column(self, tablename, column, chunk_size=1000):
     def rename_table(self, tablename, new_tablename):
-    def rename_column(self, tablename, col_name, new_col_name):
+    def rename_column(self, tablename, col_name, new_col_name, chunk_size=1000):
+    def change_column_type(self, tablename, col_name, col_type, chunk_size=1000):
+
+    ### MIGRATIONS ###
+    def migrate(self, tablename, columns, renames=None, chunk_size=1000, pause=0):
 
     ### EVENTS ###
     def create_trigger(self, trigger_name, before_after, event, target_table, action):
+    def drop_trigger(self, trigger_name):
 
     ### INDEX ### (maybe implement on a future version?)
     # create, drop, reindex
@@ -58,9 +88,7 @@ Use the factory to obtain a manager for a specific domain.
     # Attach and Detach
     # Begin/Commit/Rollback and Savepoint/Release are done automatically (intended for user specified behaviour)
     # [EXPLAIN, ON CONFLICT, UPSERT, RETURNING]
-    # PRAGMA
-
-    ## Aggregation functions can theoretically be done on the user side. These are the most likely to get implemented in the near future.
+    # PRAGMA (except for the ones used by the maintenance methods)
 
 '''
 
@@ -110,6 +138,28 @@ class DatabaseManager:
         foreign keys should only be set after primary keys are set
         '''
         self.entities[entity].foreign_key[attrib] = ref_entity
+
+    def set_fulltext(self, entity, *text_cols, tokenizer="unicode61"):
+        '''
+        makes the given text columns searchable with search(), through a full-text index
+        tokenizer is an FTS5 tokenizer specification, e.g. "porter unicode61"
+        should be called before the tables are created
+        '''
+        self.entities[entity].fulltext = (text_cols, tokenizer)
+
+    def set_deferred(self, entity, *cols):
+        '''
+        leaves the given (large) columns out of select_from() with "*" for the given entity
+        they are loaded for the whole result the first time they are accessed, see also load_deferred()
+        '''
+        self.entities[entity].deferred = list(cols)
+
+    def set_hashable(self, entity, hashable=True):
+        '''
+        makes the objects of the given entity hashable, by their primary key
+        they can then be used in sets and as dict keys, as long as their primary key is not changed
+        '''
+        self.entities[entity].hashable = hashable
         
     def set_clear(self, entity_obj):
         '''Destroy the database objects file, if it exists.'''
@@ -129,7 +179,10 @@ class DatabaseManager:
     # The object constructor will not be available by default, this would require a complex dynamic import
     # so this build method is provided to work as a factory for instances / table rows, which can later be included to the DB
 
+    def entity_class(self, tablename):
+        '''Returns the class generated for the corresponding table.'''
+        return sql_utils.load_module(tablename.lower(), self.file_path + Entity.get_filename(tablename), tablename)
+
     def build(self, tablename, **kargs):
         '''Calls the appropriate constructor for the corresponding table.'''
-        e_class = sql_utils.load_module(tablename.lower(), self.file_path + Entity.get_filename(tablename), tablename)
-        return e_class(**kargs)
+        return self.entity_class(tablename)(**kargs)
@@ -1,20 +1,378 @@
 '''
 Async manager for SQLite databases
 '''
+from collections import namedtuple
+import asyncio
+import re
+import sqlite3
+import time
+import weakref
+import aiosqlite
 from entity import Entity
+from clauses import Zeroblob
 from utils import utils as sql_utils
 from Managers.database_manager import DatabaseManager
 
+def _columns_query(tablename, primary_key, cols, amount):
+    '''returns the query that fetches the given columns of amount rows, identified by their primary key'''
+    pk_list = ", ".join(primary_key)
+    placeholders = ", ".join([f"({', '.join('?' * len(primary_key))})"] * amount)
+    return f"SELECT {pk_list}, {', '.join(cols)} FROM {tablename} WHERE ({pk_list}) IN (VALUES {placeholders})"
+
+def _fill_columns(objects, primary_key, cols, rows):
+    '''sets the fetched columns on the objects, rows that no longer exist leave them as None'''
+    by_key = {tuple(row[:len(primary_key)]): row[len(primary_key):] for row in rows}
+    for obj in objects:
+        values = by_key.get(tuple(getattr(obj, pk) for pk in primary_key), (None,) * len(cols))
+        for col, value in zip(cols, values):
+            setattr(obj, col, value)
+
+def _is_set(obj, col):
+    '''checks if a slot holds a value, without triggering a deferred load'''
+    try:
+        getattr(type(obj), col).__get__(obj)
+    except AttributeError:
+        return False
+    return True
+
+class _DeferredLoader:
+    '''
+    Loads the columns left out of a select, the first time one of them is accessed on any object of the result.
+    Attribute access cannot wait for the async connection, so a short-lived synchronous one is used instead.
+    See ManagerSQLite.load_deferred() to load them ahead of time, without blocking.
+    '''
+    chunk_size = 500
+
+    def __init__(self, database_file, tablename, primary_key, columns):
+        self.database_file = database_file
+        self.tablename = tablename
+        self.primary_key = primary_key
+        self.columns = columns # the columns left out
+        self.objects = [] # weak references, the objects of a result must not keep each other alive
+
+    def add(self, obj):
+        self.objects.append(weakref.ref(obj))
+
+    def __call__(self, obj, col):
+        alive = [o for o in (ref() for ref in self.objects) if o is not None]
+        pending = [o for o in alive if not _is_set(o, col)]
+        connection = sqlite3.connect(f"file:{self.database_file}?mode=ro", uri=True)
+        try:
+            for start in range(0, len(pending), self.chunk_size):
+                chunk = pending[start:start + self.chunk_size]
+                sql = _columns_query(self.tablename, self.primary_key, [col], len(chunk))
+                params = [getattr(o, pk) for o in chunk for pk in self.primary_key]
+                _fill_columns(chunk, self.primary_key, [col], connection.execute(sql, params).fetchall())
+        finally:
+            connection.close()
+        # objects with every column loaded no longer need the loader
+        self.objects = [weakref.ref(o) for o in alive if not all(_is_set(o, c) for c in self.columns)]
+        return getattr(obj, col)
+
+class _BackupAborted(Exception):
+    '''raised from the progress callback of a backup, to stop it'''
+
+class BlobStream:
+    '''
+    Async file-like access to a single BLOB value, see ManagerSQLite.open_blob()
+    The size of the value is fixed: writes cannot go past its end, see sql_utils.zeroblob()
+    '''
+    def __init__(self, manager, tablename, blob, length, mode):
+        self.manager = manager
+        self.tablename = tablename
+        self.length = length
+        self.mode = mode
+        self._blob = blob
+
+    async def _run(self, fn, *args):
+        '''runs fn on the connection thread, where the blob handle must be used'''
+        return await self.manager.conn._execute(fn, *args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def read(self, size=-1):
+        '''reads up to size bytes (all remaining bytes by default) from the current position'''
+        return await self._run(self._blob.read, size)
+
+    async def write(self, data):
+        '''writes data (any bytes-like object) at the current position'''
+        await self._run(self._blob.write, data)
+
+    async def seek(self, offset, origin=0):
+        await self._run(self._blob.seek, offset, origin)
+
+    async def tell(self):
+        return await self._run(self._blob.tell)
+
+    async def write_blob_from(self, fileobj, chunk_size=65536):
+        '''
+        Copies the contents of a (synchronous) binary file object into the blob, chunk_size bytes at a time,
+        until the file or the blob ends. Returns the number of bytes written.
+        '''
+        buffer = memoryview(bytearray(chunk_size))
+
+        def step():
+            room = min(chunk_size, self.length - self._blob.tell())
+            if room <= 0:
+                return 0
+            if hasattr(fileobj, "readinto"):
+                amount = fileobj.readinto(buffer[:room])
+                data = buffer[:amount or 0]
+            else:
+                data = memoryview(fileobj.read(room))
+                amount = len(data)
+            if amount:
+                self._blob.write(data)
+            return amount or 0
+
+        written = 0
+        while True:
+            # each chunk is read and written on the connection thread, keeping the event loop free
+            amount = await self._run(step)
+            if not amount:
+                return written
+            written += amount
+
+    async def read_blob_into(self, fileobj, chunk_size=65536):
+        '''
+        Copies the blob, from the current position, into a (synchronous) binary file object, chunk_size bytes at a time.
+        Returns the number of bytes read.
+        sqlite3 blobs have no readinto(), so each chunk is read into a new bytes object (unlike write_blob_from(),
+        which reuses its buffer), only one chunk is held in memory at a time.
+        '''
+        def step():
+            data = self._blob.read(chunk_size)
+            if data:
+                fileobj.write(data)
+            return len(data)
+
+        read = 0
+        while True:
+            amount = await self._run(step)
+            if not amount:
+                return read
+            read += amount
+
+    async def close(self):
+        '''closes the blob, writes are committed at this point'''
+        if self._blob is None:
+            return
+        await self._run(self._blob.close)
+        self._blob = None
+        if self.mode == "w":
+            await self.manager.conn.commit()
+            if self.tablename in self.manager._pinned:
+                await self.manager.resync(self.tablename)
+
 class ManagerSQLite(DatabaseManager):
 
     def __init__(self, connection, filepath="resources/"):
         super(ManagerSQLite, self).__init__(connection, filepath)
+        self._write_queue = None
+        self._write_task = None
+        self._memory = None # in-memory copy of the pinned tables
+        self._pinned = set()
+        # held by writes from their commit to the file until their copy in memory, and by copies into memory,
+        # so a copy never misses a write nor receives one it already holds
+        self._memory_lock = asyncio.Lock()
 
     async def close(self):
         '''should be called at the end of execution'''
         #await await self.conn.execute("PRAGMA optimize;")
+        await self.disable_write_behind()
+        if self._memory is not None:
+            await self._memory.close()
+            self._memory = None
         await self.conn.close()
 
+    async def _database_file(self):
+        '''returns the path of the file backing the main database'''
+        databases = await self.conn.execute_fetchall("PRAGMA database_list")
+        for _, name, file in databases:
+            if name == "main":
+                return file
+        return ""
+
+    ### MAINTENANCE ###
+
+    async def backup_to(self, path, pages_per_step=64, sleep=0.05, progress=None, max_restarts=10):
+        '''
+        Copies the database into the file at path, using the SQLite online backup API.
+        The copy is done in steps of pages_per_step pages, waiting sleep seconds between them,
+        so other connections can keep reading and writing while it runs.
+        progress, if given, is called as progress(status, remaining, total) after each step,
+        from the thread that performs the backup.
+        The backup runs on its own connection, so this manager remains usable meanwhile.
+        Writes from any other connection, this manager's included, make SQLite restart the copy:
+        after max_restarts restarts the copy is done again on the manager's own connection,
+        whose writes do not restart it, and the manager's statements wait until it is over.
+        Cancelling the call stops the backup at its next step.
+        '''
+        database_file = await self._database_file()
+        if not database_file:
+            raise ValueError("In-memory databases cannot be backed up with backup_to()")
+
+        state = {"remaining": None, "restarts": 0, "aborted": False}
+
+        # sqlite3 only sleeps on BUSY / LOCKED steps, the pause between successful steps happens here,
+        # on the backup thread, so the event loop is not blocked
+        def step(status, remaining, total):
+            if state["aborted"]:
+                raise _BackupAborted("The backup was cancelled")
+            if state["remaining"] is not None and remaining > state["remaining"]:
+                state["restarts"] += 1
+                if state["restarts"] > max_restarts:
+                    raise _BackupAborted(f"The backup was restarted more than {max_restarts} times")
+            state["remaining"] = remaining
+            if progress is not None:
+                progress(status, remaining, total)
+            if remaining:
+                time.sleep(sleep)
+
+        def final_step(status, remaining, total):
+            if state["aborted"]:
+                raise _BackupAborted("The backup was cancelled")
+            if progress is not None:
+                progress(status, remaining, total)
+
+        async def run(backup):
+            # the connections must not be closed while the backup thread is still using them
+            future = asyncio.ensure_future(backup)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                state["aborted"] = True
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()
+                raise
+
+        source = await aiosqlite.connect(database_file)
+        try:
+            target = await aiosqlite.connect(path)
+            try:
+                try:
+                    await run(source.backup(target, pages=pages_per_step, progress=step, sleep=sleep))
+                except _BackupAborted:
+                    await run(self.conn._execute(self.conn._conn.backup, target._conn,
+                        pages=pages_per_step, progress=final_step, sleep=sleep))
+            finally:
+                await target.close()
+        finally:
+            await source.close()
+
+    async def set_auto_vacuum(self, mode="INCREMENTAL"):
+        '''
+        Sets the auto_vacuum mode of the database (NONE, FULL or INCREMENTAL).
+        Preferably called before create_tables(), otherwise the whole database
+        must be rebuilt with VACUUM for the change to take effect.
+        '''
+        modes = {"NONE": 0, "FULL": 1, "INCREMENTAL": 2}
+        mode = mode.upper()
+        if mode not in modes:
+            raise ValueError(f"Invalid auto_vacuum mode: {mode}")
+        await self.conn.execute(f"PRAGMA auto_vacuum = {mode}")
+        (current,), = await self.conn.execute_fetchall("PRAGMA auto_vacuum")
+        if current != modes[mode]:
+            await self.conn.execute("VACUUM")
+            # VACUUM may renumber rowids, which full-text indexes refer to
+            for entity in self.entities.values():
+                if entity.fulltext is not None:
+                    await self.rebuild_fulltext(entity.e_name)
+        await self.conn.commit()
+
+    async def incremental_vacuum(self, max_pages=0):
+        '''
+        Returns up to max_pages free pages to the filesystem (all of them if max_pages is 0),
+        shrinking the file without locking the database for a full VACUUM.
+        Requires auto_vacuum to be INCREMENTAL, see set_auto_vacuum().
+        Returns the number of pages that were freed.
+        '''
+        (before,), = await self.conn.execute_fetchall("PRAGMA freelist_count")
+        # executescript steps the pragma to completion, a plain execute frees a single page
+        await self.conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        (after,), = await self.conn.execute_fetchall("PRAGMA freelist_count")
+        return before - after
+
+    ### IN-MEMORY TABLES ###
+    # Pinned tables are copied into an in-memory database, which then serves their reads.
+    # Writes made through insert(), update() and delete_table_contents() are applied to both copies,
+    # anything else that changes their contents (triggers, raw statements) requires a resync().
+
+    async def pin_in_memory(self, *tables):
+        '''Copies the given tables into memory, reads on them (without joins to other tables) will not touch the file'''
+        if self._memory is None:
+            self._memory = await aiosqlite.connect(":memory:")
+        for table in tables:
+            await self._copy_to_memory(table)
+
+    async def unpin(self, *tables):
+        '''Reads on the given tables go back to the file'''
+        async with self._memory_lock:
+            for table in tables:
+                self._pinned.discard(table)
+                await self._memory.execute(f"DROP TABLE IF EXISTS {table}")
+            await self._memory.commit()
+
+    async def resync(self, *tables):
+        '''Copies the given pinned tables (all of them, by default) into memory again'''
+        for table in tables or list(self._pinned):
+            await self._copy_to_memory(table)
+
+    async def _copy_to_memory(self, table):
+        '''
+        (re)creates a table in memory with the same schema and rows it has in the file, then pins it.
+        The rows are copied into a table with a temporary name, so reads keep using the previous copy until it is replaced.
+        Writes wait meanwhile.
+        '''
+        copy = f"_sqlall_copy_{table}"
+        async with self._memory_lock:
+            (schema,), = await self.conn.execute_fetchall("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            schema = re.sub(rf"^(CREATE TABLE (IF NOT EXISTS )?)[\"`\[]?{re.escape(table)}[\"`\]]?", rf"\g<1>{copy}",
+                schema, count=1, flags=re.IGNORECASE)
+            await self._memory.execute(f"DROP TABLE IF EXISTS {copy}")
+            await self._memory.execute(schema)
+            cursor = await self.conn.execute(f"SELECT * FROM {table}")
+            placeholders = ", ".join("?" * len(cursor.description))
+            while True:
+                rows = await cursor.fetchmany(1000)
+                if not rows:
+                    break
+                await self._memory.executemany(f"INSERT INTO {copy} VALUES ({placeholders})", rows)
+            await cursor.close()
+            # a single script, so no read runs between both statements
+            await self._memory.executescript(f"BEGIN; DROP TABLE IF EXISTS {table}; ALTER TABLE {copy} RENAME TO {table}; COMMIT;")
+            self._pinned.add(table)
+
+    async def _write_in_memory(self, sql, params, tablename):
+        '''applies a write, already committed to the file, to the in-memory copy of a pinned table'''
+        if tablename in self._pinned:
+            await self._memory.execute(sql, params)
+            await self._memory.commit()
+
+    def _connection_for(self, tables_obj, args):
+        '''returns the in-memory connection when every table read by a query is pinned'''
+        if str(tables_obj) not in self._pinned:
+            return self.conn
+        for arg in args:
+            joined = getattr(arg, "table_B", None)
+            if joined is not None and joined.e_name not in self._pinned:
+                return self.conn
+        return self._memory
+
+    async def _schema_changed(self, tablename, new_tablename=None):
+        '''keeps the in-memory copy of a pinned table in line with schema changes'''
+        if tablename not in self._pinned:
+            return
+        if new_tablename is not None:
+            await self.unpin(tablename)
+            tablename = new_tablename
+        await self.pin_in_memory(tablename)
+
     ### CREATE ###
 
     def _create_table_query(self, entity, readable=False):
@@ -32,6 +390,13 @@ class ManagerSQLite(DatabaseManager):
                 sql += F",{endl}FOREIGN KEY ({key}) REFERENCES {value} ({key})"
         return sql + f"{endl})"
 
+    async def _create_table(self, entity):
+        '''creates the table of an entity, along with its full-text index, if any'''
+        #print(entity._create_table_query(None, True))
+        await self.conn.execute(self._create_table_query(entity))
+        if entity.fulltext is not None:
+            await self._create_fulltext(entity)
+
     async def create_tables(self):
         '''
         sends in the queries for creating all the tables predicted in the setup operations
@@ -39,14 +404,13 @@ class ManagerSQLite(DatabaseManager):
         '''
         for entity in self.entities.values():
             entity.writedown(self.file_path)
-            #print(entity._create_table_query(None, True))
-            await self.conn.execute(self._create_table_query(entity))
+            await self._create_table(entity)
         await self.conn.commit()
 
     async def add_table(self, entity):
         '''Adds a single table to the database, entity must be generated / set separately'''
         entity.writedown(self.file_path)
-        await self.conn.execute(self._create_table_query(entity))
+        await self._create_table(entity)
         await self.conn.commit()
 
     async def create_view(self, view_name, select_obj):
@@ -58,6 +422,144 @@ class ManagerSQLite(DatabaseManager):
         await self.conn.execute(sql)
         await self.conn.commit()
 
+    async def create_materialized_view(self, view_name, select_obj, key, sources=None):
+        '''
+        Creates a materialized view: the results of select_obj are stored in a real table,
+        that can be read as any other entity, and kept up to date by triggers on the source tables.
+        key is the column (or list of columns) of the view that uniquely identifies its rows,
+        it becomes the primary key of the view table.
+        When a source table also has the key columns, only the affected rows are recomputed,
+        otherwise any change to that table rebuilds the whole view.
+        sources are the tables read by the query, taken from select_obj if it was built
+        with sql_utils.select_query()
+        '''
+        if isinstance(key, str):
+            key = [key]
+        if sources is None:
+            sources = getattr(select_obj, "tables", None)
+        if not sources:
+            raise ValueError(f"Source tables of materialized view {view_name} could not be determined")
+        query = str(select_obj)
+
+        # let sqlite figure out the columns of the view and their types
+        await self.conn.execute(f"CREATE TEMP TABLE _sqlall_probe AS SELECT * FROM ({query}) LIMIT 0")
+        columns = await self.conn.execute_fetchall("PRAGMA temp.table_info(_sqlall_probe)")
+        await self.conn.execute("DROP TABLE temp._sqlall_probe")
+        args_dict = {col_name: col_type for _, col_name, col_type, *_ in columns}
+        for col in args_dict:
+            if not col.isidentifier():
+                raise ValueError(f"Column {col} of materialized view {view_name} is not a valid name, give it an alias (AS name)")
+        for col in key:
+            if col not in args_dict:
+                raise ValueError(f"Key column {col} is not part of materialized view {view_name}")
+
+        entity = Entity(view_name, args_dict)
+        entity.primary_key = key
+        entity.view_query = query
+        entity.view_sources = list(sources)
+        # the entity is only registered (and its class written) once its table exists
+        await self._create_table(entity)
+        await self.conn.commit()
+        entity.writedown(self.file_path)
+        self.entities[view_name] = entity
+
+        await self._create_view_triggers(entity)
+        await self.refresh(view_name)
+
+    @staticmethod
+    def _view_triggers(entity):
+        '''returns the (name, event, source table) of each trigger that keeps a materialized view updated'''
+        return [(f"{entity.e_name}_{table}_{event.lower()}", event, table)
+            for table in entity.view_sources for event in ("INSERT", "UPDATE", "DELETE")]
+
+    async def _create_view_triggers(self, entity):
+        '''installs the triggers that keep a materialized view updated on its source tables'''
+        for table in dict.fromkeys(entity.view_sources):
+            table_info = await self.conn.execute_fetchall(f"PRAGMA table_info({table})")
+            for sql in self._view_trigger_queries(entity, table, [col_name for _, col_name, *_ in table_info]):
+                await self.conn.execute(sql)
+        await self.conn.commit()
+
+    def _view_trigger_queries(self, entity, table, table_cols):
+        '''returns the statements creating the triggers of a materialized view on one source table, with the given columns'''
+        view_name, query, key = entity.e_name, entity.view_query, entity.primary_key
+        rows = {"INSERT": ["NEW"], "UPDATE": ["OLD", "NEW"], "DELETE": ["OLD"]}
+        queries = []
+        for trigger, event, source in self._view_triggers(entity):
+            if source != table:
+                continue
+            if all(col in table_cols for col in key):
+                action = [sql for row in rows[event] for sql in self._refresh_rows_query(view_name, query, key, row)]
+            else:
+                action = self._refresh_query(view_name, query)
+            queries.append(self._create_trigger_query(trigger, "AFTER", event, table, action))
+        return queries
+
+    def _refresh_query(self, view_name, query):
+        '''returns the statements that rebuild a whole materialized view'''
+        return [f"DELETE FROM {view_name}", f"INSERT INTO {view_name} {query}"]
+
+    def _refresh_rows_query(self, view_name, query, key, row):
+        '''returns the statements that recompute the rows of a materialized view matching the key of row (NEW or OLD)'''
+        view_cond = " AND ".join(f"{col}={row}.{col}" for col in key)
+        query_cond = " AND ".join(f"_sqlall_src.{col}={row}.{col}" for col in key)
+        return [f"DELETE FROM {view_name} WHERE {view_cond}",
+            f"INSERT INTO {view_name} SELECT * FROM ({query}) AS _sqlall_src WHERE {query_cond}"]
+
+    async def refresh(self, view_name):
+        '''Rebuilds a materialized view from scratch, see create_materialized_view()'''
+        query = self.entities[view_name].view_query
+        if query is None:
+            raise ValueError(f"{view_name} is not a materialized view")
+        for sql in self._refresh_query(view_name, query):
+            await self.conn.execute(sql)
+        await self.conn.commit()
+
+    ### FULL-TEXT SEARCH ###
+    # Entities marked with set_fulltext() get an FTS5 index over the chosen columns.
+    # The index is an external-content table named <table>_fts, kept in sync by triggers,
+    # that refers to the rows of the table by their rowid.
+
+    async def _create_fulltext(self, entity):
+        '''creates the full-text index of an entity and the triggers that keep it in sync'''
+        cols, tokenizer = entity.fulltext
+        fts = f"{entity.e_name}_fts"
+        col_list = ", ".join(cols)
+        new_values = ", ".join(f"new.{col}" for col in cols)
+        old_values = ", ".join(f"old.{col}" for col in cols)
+        await self.conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({col_list}, "
+            f"content='{entity.e_name}', content_rowid='rowid', tokenize='{tokenizer}')")
+
+        insert = f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_values})"
+        delete = f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_values})"
+        await self.create_trigger(f"{fts}_insert", "AFTER", "INSERT", entity.e_name, insert)
+        await self.create_trigger(f"{fts}_delete", "AFTER", "DELETE", entity.e_name, delete)
+        await self.create_trigger(f"{fts}_update", "AFTER", "UPDATE", entity.e_name, [delete, insert])
+        await self.rebuild_fulltext(entity.e_name)
+
+    async def rebuild_fulltext(self, tablename):
+        '''Rebuilds the full-text index of a table from its contents, e.g. after a VACUUM'''
+        fts = f"{tablename}_fts"
+        await self.conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        await self.conn.commit()
+
+    async def search(self, tablename, query, limit=None, rank=True):
+        '''
+        Returns the objects of a table whose full-text columns match query (FTS5 query syntax),
+        the best matches first (by bm25) unless rank is set to false.
+        The table must have been marked with set_fulltext() before being created.
+        '''
+        fts = f"{tablename}_fts"
+        sql = (f"SELECT {tablename}.* FROM {fts} JOIN {tablename} ON {tablename}.rowid = {fts}.rowid "
+            f"WHERE {fts} MATCH ?")
+        if rank:
+            sql += f" ORDER BY {fts}.rank"
+        if limit is not None:
+            sql += f" {str(sql_utils.limit(int(limit)))}"
+        rows = await self.conn.execute_fetchall(sql, (query,))
+        e_class = self.entity_class(tablename)
+        return [e_class._from_row(row) for row in rows]
+
     ### USER OPERATIONS ###
     # Consider if its worthy over having your own user system
 
@@ -78,12 +580,31 @@ class ManagerSQLite(DatabaseManager):
     # Entities should therefore be loaded in when the manager is initialized, if they exist
 
     async def load_entities(self):
-        tablenames = await self.conn.execute_fetchall(f"SELECT name FROM sqlite_master WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
+        tablenames = await self.conn.execute_fetchall(f"SELECT name, sql FROM sqlite_master WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
         if tablenames:
             #print(tablenames)
-            for table, in tablenames:
+            # virtual tables (full-text indexes) and their shadow tables are not entities
+            virtual = [table for table, sql in tablenames if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+            for table, _ in tablenames:
+                # a migration interrupted before its swap leaves the original table intact
+                if table.startswith("_sqlall_migrate_"):
+                    await self._drop_migration(table)
+                    continue
+                if any(table == vtable or table.startswith(f"{vtable}_") for vtable in virtual):
+                    continue
                 e_class = sql_utils.load_module(table.lower(), self.file_path + Entity.get_filename(table), table)
-                self.entities[table] = Entity(table, e_class._attribute_types)
+                self.entities[table] = Entity(table, dict(e_class._attribute_types))
+                self.entities[table].primary_key = list(e_class._primary_key)
+                self.entities[table].foreign_key = dict(getattr(e_class, "_foreign_key", {}))
+                self.entities[table].view_query = getattr(e_class, "_view_query", None)
+                self.entities[table].view_sources = list(getattr(e_class, "_view_sources", []))
+                self.entities[table].shard_key = getattr(e_class, "_shard_key", None)
+                self.entities[table].hashable = e_class.__hash__ is not None
+                self.entities[table].fulltext = getattr(e_class, "_fulltext", None)
+                self.entities[table].deferred = list(getattr(e_class, "_deferred", ()))
+                # class files written by earlier versions lack the members used by select_from()
+                if not hasattr(e_class, "_from_row") or "__weakref__" not in getattr(e_class, "__slots__", ()):
+                    self.entities[table].writedown(self.file_path, rewrite=True)
 
     ### INSERT ###
 
@@ -102,17 +623,26 @@ class ManagerSQLite(DatabaseManager):
         if await self.exists(c_name, **pk_dict):
             return
 
-        vals = []
+        sql, params = self._insert_query(Obj, replace)
+        await self._write(sql, params, c_name)
+
+    @staticmethod
+    def _placeholder(value):
+        '''returns the placeholder for a value within a statement, and the parameter bound to it'''
+        if isinstance(value, Zeroblob): # the blob is allocated by SQLite, only its size is bound
+            return "zeroblob(?)", value.size
+        return "?", value
+
+    def _insert_query(self, Obj, replace=False):
+        '''returns the statement used to insert an instance, and its parameters'''
+        c_name = Obj.__class__.__name__
+
+        vals, params = [], []
         for key in self.entities[c_name].args_dict.keys():
-            vals.append( (getattr(Obj, key)) )
-        vals_concat = ""
-        for value in vals:
-            if isinstance(value, str):
-                vals_concat += f"\"{value}\""
-            else:
-                vals_concat += str(value)
-            if value != vals[-1]:
-                vals_concat += ", "
+            placeholder, param = self._placeholder(getattr(Obj, key))
+            vals.append(placeholder)
+            params.append(param)
+        vals_concat = ", ".join(vals)
 
         keyjoin = ", ".join( self.entities[c_name].args_dict.keys() )
 
@@ -120,9 +650,7 @@ class ManagerSQLite(DatabaseManager):
         if replace:
             command = "REPLACE"
 
-        sql = f"{command} INTO {c_name} ({keyjoin}) VALUES ({vals_concat})"
-        await self.conn.execute(sql)
-        await self.conn.commit()
+        return f"{command} INTO {c_name} ({keyjoin}) VALUES ({vals_concat})", params
 
     async def build_and_insert(self, tablename, **kargs):
         '''Insert instance into database right after instantiation, then returns it'''
@@ -134,22 +662,150 @@ class ManagerSQLite(DatabaseManager):
 
     async def update(self, Obj):
         '''Update a database instance (single row)'''
-        c_name = Obj.__class__.__name__
+        sql, params = self._update_query(Obj)
+        await self._write(sql, params, Obj.__class__.__name__)
 
-        pk_list = []
-        for pk in Obj.__class__._primary_key:
-            pk_list.append(f"{pk}={getattr(Obj, pk)}")
-        cond_string = " AND ".join(pk_list)        
+    def _update_query(self, Obj):
+        '''returns the statement used to update an instance, and its parameters'''
+        c_name = Obj.__class__.__name__
 
-        up_list = []
+        up_list, params = [], []
         for attribute in Obj.__class__._attribute_types.keys():
             if attribute not in Obj.__class__._primary_key:
-                up_list.append(f"{attribute}={getattr(Obj, attribute)}")
+                placeholder, param = self._placeholder(getattr(Obj, attribute))
+                up_list.append(f"{attribute}={placeholder}")
+                params.append(param)
         set_string = ", ".join(up_list)
 
-        sql = f"UPDATE {c_name} SET {set_string} WHERE {cond_string}"
-        await self.conn.execute(sql)
-        await self.conn.commit()
+        pk_list = []
+        for pk in Obj.__class__._primary_key:
+            pk_list.append(f"{pk}=?")
+            params.append(getattr(Obj, pk))
+        cond_string = " AND ".join(pk_list)
+
+        return f"UPDATE {c_name} SET {set_string} WHERE {cond_string}", params
+
+    ### WRITE-BEHIND ###
+    # When enabled, insert() and update() statements are queued and committed in batches
+    # by a single background task, instead of each call committing on its own.
+
+    def enable_write_behind(self, batch_size=100, max_delay=0.05, max_queue=1000):
+        '''
+        Starts committing writes in groups. A batch is committed once it holds batch_size statements,
+        or max_delay seconds after its first statement was queued, whichever comes first.
+        Callers of insert() / update() still wait until their own statement is committed.
+        At most max_queue statements may be waiting, further writes wait for room in the queue.
+        Must be called with an event loop running.
+        '''
+        if self._write_task is not None:
+            return
+        self._write_queue = asyncio.Queue(max_queue)
+        self._write_task = asyncio.get_running_loop().create_task(self._write_behind(batch_size, max_delay))
+
+    async def disable_write_behind(self):
+        '''Commits every queued write, then goes back to committing each write on its own'''
+        if self._write_task is None:
+            return
+        queue, task = self._write_queue, self._write_task
+        # writes from now on are committed on their own, instead of being queued behind the sentinel
+        self._write_queue = None
+        self._write_task = None
+        await queue.put(None)
+        await task
+        # writes that were waiting for room in the queue got in after the sentinel
+        while not queue.empty():
+            async with self._memory_lock:
+                await self._commit_batch([queue.get_nowait() for _ in range(queue.qsize())])
+
+    async def _write(self, sql, params, tablename):
+        '''executes and commits a write statement on tablename, or queues it when write-behind is enabled'''
+        if self._write_queue is None:
+            async with self._memory_lock:
+                await self.conn.execute(sql, params)
+                await self.conn.commit()
+                await self._write_in_memory(sql, params, tablename)
+            return
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((sql, params, tablename, future))
+        await future
+
+    async def _write_behind(self, batch_size, max_delay):
+        '''background task that drains the write queue, one transaction per batch'''
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + max_delay
+            while len(batch) < batch_size:
+                try:
+                    item = await asyncio.wait_for(self._write_queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            async with self._memory_lock:
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch):
+        '''executes a batch of queued writes in a single transaction, then resolves their callers'''
+        done = []
+        for sql, params, tablename, future in batch:
+            try:
+                await self.conn.execute(sql, params)
+            except Exception as e: # a failed statement only affects its own caller
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                done.append((sql, params, tablename, future))
+        try:
+            await self.conn.commit()
+        except Exception as e:
+            # otherwise the statements would stay pending and be committed along with the next batch
+            await self.conn.rollback()
+            for *_, future in done:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for sql, params, tablename, future in done:
+            try:
+                await self._write_in_memory(sql, params, tablename)
+            except Exception as e: # must not stop the background task, later writers would wait forever
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done(): # the caller may have been cancelled meanwhile
+                future.set_result(None)
+
+    ### BLOB ###
+    # Large binary values can be streamed in and out of the database instead of being held in memory:
+    # insert the object with sql_utils.zeroblob(size) as the value, then write into it with open_blob().
+
+    async def open_blob(self, tablename, column, pk, mode="r"):
+        '''
+        Opens the BLOB stored in column, for the row of tablename with the given primary key
+        (a single value, or a tuple for composite keys), and returns a BlobStream.
+        mode is "r" for reading or "w" for reading and writing.
+        Can be used as an async context manager: async with await manager.open_blob(...) as blob:
+        '''
+        if mode not in ("r", "w"):
+            raise ValueError(f"Invalid blob mode: {mode}")
+        primary_key = self.entities[tablename].primary_key
+        if not isinstance(pk, tuple):
+            pk = (pk,)
+        cond_string = " AND ".join(f"{key}=?" for key in primary_key)
+        rows = await self.conn.execute_fetchall(f"SELECT rowid FROM {tablename} WHERE {cond_string}", pk)
+        if not rows:
+            raise ValueError(f"No row of {tablename} has the primary key {pk}")
+        (rowid,), = rows
+        # aiosqlite does not wrap incremental blob I/O, the handle is used on its connection thread
+        blob = await self.conn._execute(self.conn._conn.blobopen, tablename, column, rowid, readonly=(mode == "r"))
+        length = await self.conn._execute(len, blob)
+        return BlobStream(self, tablename, blob, length, mode)
 
     ### SELECT ###
 
@@ -167,7 +823,7 @@ class ManagerSQLite(DatabaseManager):
         sql = f"SELECT {str(cols_obj)} FROM {str(tables_obj)}"
         for arg in args:
             sql += f" {str(arg)}" # whitespace is relevant here
-        return await self.conn.execute_fetchall(sql)
+        return await self._connection_for(tables_obj, args).execute_fetchall(sql)
 
     async def select_from(self, tables_obj, cols_obj="*", *args):
         '''
@@ -176,14 +832,56 @@ class ManagerSQLite(DatabaseManager):
         A view is also a valid argument to pass as tables_obj
         '''
         tablename = str(tables_obj)
-        rows = await self._select(tables_obj, cols_obj, *args)
+        entity = self.entities[tablename]
+        e_class = self.entity_class(tablename)
+        if str(cols_obj) == "*" and not entity.deferred:
+            # only the columns of tablename, in their declared order, so rows can be passed straight to the class
+            rows = await self._select(tables_obj, f"{tablename}.*", *args)
+            return [e_class._from_row(row) for row in rows]
+
+        if str(cols_obj) == "*":
+            cols = [col for col in entity.args_dict.keys() if col not in entity.deferred]
+        else:
+            cols = [col.strip().split(".")[-1] for col in str(cols_obj).split(",")]
+            for col in cols:
+                if col not in entity.args_dict:
+                    raise ValueError(f"{col} is not a column of {tablename}, see aggregate() for expressions")
+        # the primary key is always selected, it is needed to load the other columns later on
+        cols += [pk for pk in entity.primary_key if pk not in cols]
+        rows = await self._select(tables_obj, ", ".join(f"{tablename}.{col}" for col in cols), *args)
 
-        result = []
+        missing = [col for col in entity.args_dict.keys() if col not in cols]
+        loader = _DeferredLoader(await self._database_file(), tablename, entity.primary_key, missing)
+        objects = []
         for row in rows:
-            arg_dict = dict( zip(self.entities[tablename].args_dict.keys(), row) )
-            result.append(self.build(tablename, **arg_dict))
+            obj = e_class.__new__(e_class)
+            for col, value in zip(cols, row):
+                setattr(obj, col, value)
+            obj._loader = loader
+            loader.add(obj)
+            objects.append(obj)
+        return objects
 
-        return result
+    async def load_deferred(self, objects, *cols):
+        '''
+        Loads the given columns (by default, every column that was left out) of objects from the same table,
+        in a few queries, instead of doing it on the first attribute access.
+        '''
+        if not objects:
+            return
+        tablename = type(objects[0]).__name__
+        entity = self.entities[tablename]
+        if not cols:
+            cols = [col for col in entity.args_dict.keys() if not all(_is_set(obj, col) for obj in objects)]
+        if not cols:
+            return
+        chunk_size = _DeferredLoader.chunk_size
+        for start in range(0, len(objects), chunk_size):
+            chunk = objects[start:start + chunk_size]
+            sql = _columns_query(tablename, entity.primary_key, cols, len(chunk))
+            params = [getattr(obj, pk) for obj in chunk for pk in entity.primary_key]
+            rows = await self.conn.execute_fetchall(sql, params)
+            _fill_columns(chunk, entity.primary_key, cols, rows)
 
     async def select_all_from(self, tables_obj, *args):
         '''Helper'''
@@ -194,15 +892,71 @@ class ManagerSQLite(DatabaseManager):
         count_tuple = await self._select(tables_obj, "count(*)", *args)
         return count_tuple[0][0]
 
+    async def aggregate(self, tables_obj, *args, group_by=None, sum=None, avg=None, min=None, max=None, count=None, having=None):
+        '''
+        Computes aggregates inside the database, in a single statement.
+        sum, avg, min, max and count take a column name or a list of column names,
+        count=True (or "*") counts the rows of each group. group_by takes a list of column names,
+        having takes a condition string or a utils.where() object, applied to the groups.
+        args are the same clauses accepted by select_from() (joins, where, order_by, limit).
+        Returns a list of namedtuples, with the group_by columns followed by fields
+        named after the aggregates, e.g. sum_prod_price or count.
+        These names can also be used within order_by() and having.
+        '''
+        if group_by is None:
+            group_by = []
+        elif isinstance(group_by, str):
+            group_by = [group_by]
+
+        cols = list(group_by)
+        fields = [col.split(".")[-1] for col in group_by]
+        functions = {"sum": sum, "avg": avg, "min": min, "max": max, "count": count}
+        for function, columns in functions.items():
+            if columns is None or columns is False:
+                continue
+            if columns is True:
+                columns = ["*"]
+            elif isinstance(columns, str):
+                columns = [columns]
+            for col in columns:
+                alias = function if col == "*" else f"{function}_{col.replace('.', '_')}"
+                cols.append(f"{function}({col}) AS {alias}")
+                fields.append(alias)
+        if len(cols) == len(group_by):
+            raise ValueError("aggregate() needs at least one aggregate function")
+
+        # GROUP BY / HAVING must come after joins and conditions, but before ordering and limits
+        before, after = [], []
+        for arg in args:
+            if str(arg).upper().startswith(("ORDER BY", "LIMIT")):
+                after.append(arg)
+            else:
+                before.append(arg)
+        if group_by:
+            before.append(sql_utils.group_by(*group_by))
+        if having is not None:
+            before.append(sql_utils.having(having))
+
+        rows = await self._select(tables_obj, ", ".join(cols), *before, *after)
+        row_class = namedtuple("Aggregate", fields, rename=True)
+        return [row_class(*row) for row in rows]
+
     ######## ALL FUNCTIONS BELOW THIS POINT ARE UNTESTED !!! some are not even done yet
 
     ### DROP / DELETE ### 
 
     async def drop_table(self, tablename):
-        '''Delete a table from the database'''
+        '''Delete a table from the database, along with the triggers that keep it updated if it is a materialized view'''
+        if tablename in self.entities and self.entities[tablename].view_query is not None:
+            for trigger, _, _ in self._view_triggers(self.entities[tablename]):
+                await self.drop_trigger(trigger)
         sql = f"DROP TABLE {tablename}"
         await self.conn.execute(sql)
+        if tablename in self.entities and self.entities[tablename].fulltext is not None:
+            await self.conn.execute(f"DROP TABLE IF EXISTS {tablename}_fts")
         await self.conn.commit()
+        if tablename in self._pinned:
+            await self.unpin(tablename)
 
     async def drop_tables(self, *tables):
         '''Helper to delete multiple tables'''
@@ -216,8 +970,10 @@ class ManagerSQLite(DatabaseManager):
     async def delete_table_contents(self, tablename):
         '''Delete all contents within a table, the schema is preserved'''
         sql = f"DELETE FROM {tablename}"
-        await self.conn.execute(sql)
-        await self.conn.commit()
+        async with self._memory_lock:
+            await self.conn.execute(sql)
+            await self.conn.commit()
+            await self._write_in_memory(sql, (), tablename)
 
     async def clear_contents(self):
         '''Delete all database contents, preserving the schemas'''
@@ -235,25 +991,23 @@ class ManagerSQLite(DatabaseManager):
         sql = f"ALTER TABLE {tablename} ADD {col_name} {col_type}"
         await self.conn.execute(sql)
         await self.conn.commit()
+        await self._schema_changed(tablename)
 
     async def add_columns(self, tablename, **columns):
         '''Adds multiple columns to a table, in a more pythonic syntax'''
         for key, value in columns.items():
             await self.add_column(tablename, key, value)
 
-    async def drop_column(self, tablename, column):
+    async def drop_column(self, tablename, column, chunk_size=1000):
         '''
-        Removes a column / attribute from a table.
-        Only supported in newer versions of sqlite
+        Removes a column / attribute from a table, through an online migration (see migrate())
+        Columns that are part of the primary key cannot be removed.
         '''
-        # verify if column is part of primary_key before removal
-
-        # adjust the constructor in the corresponding object file
-
-        # only now drop the column in the database
-        sql = f"ALTER TABLE {tablename} DROP COLUMN {column}"
-        await self.conn.execute(sql)
-        await self.conn.commit()
+        if column in self.entities[tablename].primary_key:
+            raise ValueError(f"{column} is part of the primary key of {tablename}")
+        columns = dict(self.entities[tablename].args_dict)
+        del columns[column]
+        await self.migrate(tablename, columns, chunk_size=chunk_size)
 
     async def rename_table(self, tablename, new_tablename):
         '''
@@ -272,29 +1026,193 @@ class ManagerSQLite(DatabaseManager):
         sql = f"ALTER TABLE {tablename} RENAME TO {new_tablename}"
         await self.conn.execute(sql)
         await self.conn.commit()
+        await self._schema_changed(tablename, new_tablename)
 
-    async def rename_column(self, tablename, col_name, new_col_name):
+    async def rename_column(self, tablename, col_name, new_col_name, chunk_size=1000):
         '''
-        Renames a column on a table.
+        Renames a column on a table, through an online migration (see migrate())
         Existing instances will not have their attributes automatically renamed.
         '''
-        # verify if its a primary / foreign key
+        columns = {}
+        for key, value in self.entities[tablename].args_dict.items():
+            columns[new_col_name if key == col_name else key] = value
+        await self.migrate(tablename, columns, {col_name: new_col_name}, chunk_size=chunk_size)
 
-        # need to rename inside the obects aswell
-        sql = f"ALTER TABLE {tablename} RENAME COLUMN {col_name} TO {new_col_name}"
-        await self.conn.execute(sql)
+    async def change_column_type(self, tablename, col_name, col_type, chunk_size=1000):
+        '''Changes the declared type of a column, through an online migration (see migrate())'''
+        columns = dict(self.entities[tablename].args_dict)
+        columns[col_name] = col_type
+        await self.migrate(tablename, columns, chunk_size=chunk_size)
+
+    ### MIGRATIONS ###
+    # Changes that sqlite cannot ALTER in place are done by rebuilding the table while it is in use:
+    # a table with the new shape is created, triggers on the old table forward every change to it,
+    # the rows are copied in small transactions, then both tables are swapped in a single one.
+
+    async def migrate(self, tablename, columns, renames=None, chunk_size=1000, pause=0):
+        '''
+        Rebuilds a table with the given columns (a dict of column names and types, as in set_entity()).
+        renames maps old column names to their new names, other columns are matched by name:
+        new columns start out as NULL, and columns left out are dropped.
+        Rows are copied chunk_size at a time, waiting pause seconds between chunks,
+        so other coroutines can keep using the database.
+        The entity and its generated class are updated to the new shape.
+        The migration is refused when a trigger, view or materialized view still refers to
+        a column that is dropped or renamed: they must be dropped (and created again) first.
+        '''
+        if renames is None:
+            renames = {}
+        entity = self.entities[tablename]
+        primary_key = [renames.get(pk, pk) for pk in entity.primary_key]
+        for pk in primary_key:
+            if pk not in columns:
+                raise ValueError(f"Primary key column {pk} is missing from the new shape of {tablename}")
+
+        # the triggers of materialized views reading this table are created again for the new shape
+        views = [view for view in self.entities.values()
+            if view.view_query is not None and tablename in (view.view_sources or [])]
+        view_triggers = {name for view in views for name, _, table in self._view_triggers(view) if table == tablename}
+        # other triggers, on this table or writing to it from another one, are kept as they are,
+        # so they must not refer to the columns going away. The queries of materialized views are checked on the swap.
+        removed = [col for col in entity.args_dict.keys() if col in renames or col not in columns]
+        if removed:
+            checked = {name for view in views for name, _, _ in self._view_triggers(view)}
+            pattern = re.compile(r"\b(" + "|".join(map(re.escape, removed)) + r")\b", re.IGNORECASE)
+            table_pattern = re.compile(rf"\b{re.escape(tablename)}\b", re.IGNORECASE)
+            triggers = await self.conn.execute_fetchall("SELECT name, tbl_name, sql FROM sqlite_master WHERE type='trigger'")
+            for name, table, sql in triggers:
+                if name in checked or name.startswith((f"{tablename}_fts_", f"_sqlall_migrate_{tablename}_")):
+                    continue
+                if (table == tablename or table_pattern.search(sql)) and pattern.search(sql):
+                    raise ValueError(f"Trigger {name} refers to a column of {tablename} that is dropped or renamed")
+
+        # new column -> old column it is copied from
+        sources = {}
+        for col in entity.args_dict.keys():
+            if renames.get(col, col) in columns:
+                sources[renames.get(col, col)] = col
+        new_cols = ", ".join(["rowid"] + list(sources.keys()))
+        old_cols = ", ".join(["rowid"] + list(sources.values()))
+        new_values = ", ".join(["NEW.rowid"] + [f"NEW.{col}" for col in sources.values()])
+
+        new_entity = Entity(f"_sqlall_migrate_{tablename}", columns)
+        new_entity.primary_key = primary_key
+        new_entity.foreign_key = {renames.get(key, key): value for key, value in entity.foreign_key.items()
+            if renames.get(key, key) in columns}
+        tmp = new_entity.e_name
+        capture = [f"{tmp}_insert", f"{tmp}_update", f"{tmp}_delete"]
+
+        await self._drop_migration(tmp) # leftovers of an interrupted migration
+
+        await self.conn.execute(self._create_table_query(new_entity))
         await self.conn.commit()
+        insert = f"INSERT OR REPLACE INTO {tmp} ({new_cols}) VALUES ({new_values})"
+        delete = f"DELETE FROM {tmp} WHERE rowid=OLD.rowid"
+        await self.create_trigger(capture[0], "AFTER", "INSERT", tablename, insert)
+        await self.create_trigger(capture[1], "AFTER", "UPDATE", tablename, [delete, insert])
+        await self.create_trigger(capture[2], "AFTER", "DELETE", tablename, delete)
+
+        try:
+            last = 0
+            while True:
+                bound = await self.conn.execute_fetchall(
+                    f"SELECT rowid FROM {tablename} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?", (last, chunk_size - 1))
+                if bound:
+                    (upper,), = bound
+                    await self.conn.execute(f"INSERT OR REPLACE INTO {tmp} ({new_cols}) "
+                        f"SELECT {old_cols} FROM {tablename} WHERE rowid > ? AND rowid <= ?", (last, upper))
+                    await self.conn.commit()
+                    last = upper
+                    await asyncio.sleep(pause)
+                    continue
+                await self.conn.execute(f"INSERT OR REPLACE INTO {tmp} ({new_cols}) "
+                    f"SELECT {old_cols} FROM {tablename} WHERE rowid > ?", (last,))
+                await self.conn.commit()
+                break
+
+            # full-text triggers are recreated below when the indexed columns change
+            fulltext = entity.fulltext
+            fulltext_changed = False
+            if fulltext is not None:
+                fulltext_cols = tuple(renames.get(col, col) for col in fulltext[0] if renames.get(col, col) in columns)
+                fulltext_changed = fulltext_cols != tuple(fulltext[0])
+                fulltext = (fulltext_cols, fulltext[1]) if fulltext_cols else None
+            schema = await self.conn.execute_fetchall("SELECT name, sql FROM sqlite_master "
+                "WHERE tbl_name=? AND type IN ('trigger', 'index') AND sql IS NOT NULL", (tablename,))
+            schema = [sql for name, sql in schema if name not in capture and name not in view_triggers
+                and not (fulltext_changed and name.startswith(f"{tablename}_fts_"))]
+            for view in views:
+                schema += self._view_trigger_queries(view, tablename, list(columns.keys()))
+            # statements that fail, rolling the swap back, if a view no longer matches the table
+            checks = []
+            for view in views:
+                view_cols = ", ".join(view.args_dict.keys())
+                checks.append(f"INSERT INTO {view.e_name} SELECT * FROM ({view.view_query}) LIMIT 0")
+                checks.append(f"INSERT INTO {view.e_name} SELECT {view_cols} FROM ({view.view_query}) LIMIT 0")
+            dependent = await self.conn.execute_fetchall("SELECT name, sql FROM sqlite_master WHERE type='view'")
+            table_pattern = re.compile(rf"\b{re.escape(tablename)}\b", re.IGNORECASE)
+            checks += [f"SELECT * FROM {name} LIMIT 0" for name, sql in dependent if table_pattern.search(sql)]
 
-    ### EVENTS ### (not sure if these should be implemented)
+            # swap both tables atomically, legacy mode keeps views and triggers of other tables from being checked
+            # a single script runs without other coroutines' statements in between
+            swap = ["PRAGMA legacy_alter_table=ON", "BEGIN", f"DROP TABLE {tablename}",
+                f"ALTER TABLE {tmp} RENAME TO {tablename}"] + schema + checks + ["COMMIT"]
+            try:
+                await self.conn.executescript(";\n".join(swap) + ";")
+            except Exception:
+                if self.conn.in_transaction:
+                    await self.conn.rollback()
+                raise
+            finally:
+                await self.conn.execute("PRAGMA legacy_alter_table=OFF")
+        except Exception:
+            await self._drop_migration(tmp)
+            raise
+
+        entity.args_dict = dict(columns)
+        entity.primary_key = primary_key
+        entity.deferred = [renames.get(col, col) for col in entity.deferred if renames.get(col, col) in columns]
+        entity.foreign_key = new_entity.foreign_key
+        entity.fulltext = fulltext
+        if fulltext_changed:
+            await self.conn.execute(f"DROP TABLE IF EXISTS {tablename}_fts")
+            if fulltext is not None:
+                await self._create_fulltext(entity)
+            await self.conn.commit()
+        entity.writedown(self.file_path, rewrite=True)
+        await self._schema_changed(tablename)
+
+    async def _drop_migration(self, tmp):
+        '''drops the table a migration copies rows into, and the triggers that capture changes for it'''
+        for event in ("insert", "update", "delete"):
+            await self.drop_trigger(f"{tmp}_{event}")
+        await self.conn.execute(f"DROP TABLE IF EXISTS {tmp}")
+        await self.conn.commit()
+
+    ### EVENTS ###
     # In future implementations, these might trigger changes accross the whole application, not only on the database.
 
     async def create_trigger(self, trigger_name, before_after, event, target_table, action):
         '''
-        Add an action to be executed when a certain condition is met
-        the action passed in sould be a lambda function containing one of the implemented queries. (or the sql_utils query object?)
+        Add an action to be executed for each row of target_table affected by event (INSERT, UPDATE or DELETE)
+        before_after is either BEFORE or AFTER.
+        action is a SQL statement, or a list of statements, that may refer to the affected row as NEW / OLD
         '''
-        sql = f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {before_after}"
-        pass
+        await self.conn.execute(self._create_trigger_query(trigger_name, before_after, event, target_table, action))
+        await self.conn.commit()
+
+    @staticmethod
+    def _create_trigger_query(trigger_name, before_after, event, target_table, action):
+        '''returns the statement that creates a trigger, see create_trigger()'''
+        if not isinstance(action, (list, tuple)):
+            action = [action]
+        statements = " ".join(f"{str(stmt)};" for stmt in action)
+        return f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {before_after} {event} ON {target_table} FOR EACH ROW BEGIN {statements} END"
+
+    async def drop_trigger(self, trigger_name):
+        '''Removes a trigger from the database'''
+        await self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        await self.conn.commit()
 
     ### INDEX ### (maybe implement on a future version?)
     # create, drop, reindex
@@ -303,6 +1221,5 @@ class ManagerSQLite(DatabaseManager):
     # Attach and Detach
     # Begin/Commit/Rollback and Savepoint/Release are done automatically (intended for user specified behaviour)
     # [EXPLAIN, ON CONFLICT, UPSERT, RETURNING]
-    # PRAGMA
+    # PRAGMA (except for the ones used by the maintenance methods)
 
-    ## Aggregation functions can theoretically be done on the user side. These are the most likely to get implemented in the near future.
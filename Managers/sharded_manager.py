@@ -0,0 +1,286 @@
+'''
+Manager that partitions tables across several databases (shards)
+
+    Each shard is a regular manager, with its own file and connection, so writes to different shards
+    do not wait on each other. All shards share the same entities.
+
+    A table becomes sharded by calling set_shard_key() before the tables are created:
+    rows are routed to a shard by the hash of the key column, or by ranges of it.
+    Tables without a shard key are replicated: writes go to every shard and reads go to the first one,
+    which allows sharded tables to be joined with them within each shard. A replicated table joined
+    with a sharded one is read from every shard, returning what the join returns on each of them.
+
+    Reads on sharded tables are sent to a single shard when the shard key value is known
+    (a utils.where() comparing the key column), otherwise they are sent to all shards concurrently
+    and the results merged. utils.order_by() and utils.limit() are applied again on the merged results.
+'''
+import asyncio
+from bisect import bisect_right
+from collections import namedtuple
+import zlib
+from clauses import Where, Order_by, Limit, Join
+from Managers.database_manager import DatabaseManager
+
+class ShardedManager(DatabaseManager):
+    '''
+    Manager that spreads tables across the given managers, see sqlall.sharded_manager_async()
+    '''
+    def __init__(self, shards, filepath="resources/"):
+        super(ShardedManager, self).__init__(None, filepath)
+        self.shards = list(shards)
+        self.entities = self.shards[0].entities
+        for shard in self.shards:
+            shard.entities = self.entities
+
+    async def close(self):
+        '''should be called at the end of execution'''
+        await asyncio.gather(*[shard.close() for shard in self.shards])
+
+    ### PARTITIONING ###
+
+    def set_shard_key(self, entity, attrib, ranges=None):
+        '''
+        Partitions the given entity across the shards by the value of attrib.
+        By default rows are spread by a hash of the value,
+        ranges may instead be a sorted list with one boundary less than the number of shards:
+        values below ranges[0] go to the first shard, values from ranges[-1] on go to the last one.
+        The shard key of a row should not be changed by update().
+        '''
+        if ranges is not None:
+            ranges = list(ranges)
+            if len(ranges) != len(self.shards) - 1 or ranges != sorted(ranges):
+                raise ValueError(f"ranges must be a sorted list of {len(self.shards) - 1} boundaries")
+        self.entities[entity].shard_key = (attrib, ranges)
+
+    def _shard_index(self, tablename, value):
+        '''returns the index of the shard holding the rows of tablename with the given key value'''
+        _, ranges = self.entities[tablename].shard_key
+        if ranges is not None:
+            return bisect_right(ranges, value)
+        # crc32 is stable across processes, unlike hash()
+        return zlib.crc32(repr(value).encode()) % len(self.shards)
+
+    def _write_shards(self, Obj):
+        '''returns the shards an instance must be written to'''
+        entity = self.entities[Obj.__class__.__name__]
+        if entity.shard_key is None:
+            return self.shards
+        return [self.shards[self._shard_index(entity.e_name, getattr(Obj, entity.shard_key[0]))]]
+
+    def _read_shards(self, tablename, args):
+        '''returns the shards a query on tablename must be sent to'''
+        entity = self.entities.get(tablename)
+        if entity is None or entity.shard_key is None:
+            # a replicated table joined with a sharded one only finds the sharded rows of each shard
+            for arg in args:
+                if isinstance(arg, Join) and self.entities[arg.table_B.e_name].shard_key is not None:
+                    return self.shards
+            return self.shards[:1]
+        key = entity.shard_key[0]
+        for arg in args:
+            if isinstance(arg, Where) and key in arg.values:
+                return [self.shards[self._shard_index(tablename, arg.values[key])]]
+        return self.shards
+
+    @staticmethod
+    def _split_clauses(args):
+        '''separates order_by() and limit() objects from the other clauses'''
+        order, limit, rest = None, None, []
+        for arg in args:
+            if isinstance(arg, Order_by):
+                order = arg
+            elif isinstance(arg, Limit):
+                limit = arg
+            else:
+                rest.append(arg)
+        return order, limit, rest
+
+    @staticmethod
+    def _merge(results, order, limit):
+        '''merges the results of several shards, applying order and limit'''
+        merged = [item for result in results for item in result]
+        if order is not None:
+            col = order.col.split(".")[-1]
+            # NULLs come first in ascending order, as in SQLite
+            merged.sort(key=lambda item: (getattr(item, col) is not None, getattr(item, col)), reverse=(order.dir == "desc"))
+        if limit is not None:
+            merged = merged[:int(limit.amount)]
+        return merged
+
+    ### CREATE ###
+
+    async def create_tables(self):
+        '''creates all the tables predicted in the setup operations, on every shard'''
+        for entity in self.entities.values():
+            entity.writedown(self.file_path)
+        for shard in self.shards:
+            for entity in self.entities.values():
+                await shard._create_table(entity)
+            await shard.conn.commit()
+
+    async def add_table(self, entity):
+        '''Adds a single table to every shard, entity must be generated / set separately'''
+        entity.writedown(self.file_path)
+        for shard in self.shards:
+            await shard._create_table(entity)
+            await shard.conn.commit()
+
+    async def create_view(self, view_name, select_obj):
+        '''Creates a view on every shard, reading it only returns the rows of the first shard'''
+        await asyncio.gather(*[shard.create_view(view_name, select_obj) for shard in self.shards])
+
+    ### LOAD ###
+
+    async def load_entities(self):
+        for shard in self.shards:
+            await shard.load_entities()
+
+    ### INSERT ###
+
+    async def insert(self, Obj, replace=False):
+        '''Insert instance into the shard it belongs to, or into all of them for replicated tables'''
+        await asyncio.gather(*[shard.insert(Obj, replace) for shard in self._write_shards(Obj)])
+
+    async def build_and_insert(self, tablename, **kargs):
+        '''Insert instance into database right after instantiation, then returns it'''
+        obj = self.build(tablename, **kargs)
+        await self.insert(obj)
+        return obj
+
+    ### UPDATE ###
+
+    async def update(self, Obj):
+        '''Update a database instance (single row), on the shard it belongs to'''
+        await asyncio.gather(*[shard.update(Obj) for shard in self._write_shards(Obj)])
+
+    ### SELECT ###
+
+    async def exists(self, tablename, **kargs):
+        '''check if an object already exists in the database'''
+        obj_count = await self.count(tablename, Where(**kargs))
+        return obj_count > 0
+
+    async def select_from(self, tables_obj, cols_obj="*", *args):
+        '''
+        Returns a list of objects from the database that match the passed in conditions, if any.
+        See the module documentation for how queries are sent to the shards.
+        '''
+        shards = self._read_shards(str(tables_obj), args)
+        if len(shards) == 1:
+            return await shards[0].select_from(tables_obj, cols_obj, *args)
+        order, limit, _ = self._split_clauses(args)
+        results = await asyncio.gather(*[shard.select_from(tables_obj, cols_obj, *args) for shard in shards])
+        return self._merge(results, order, limit)
+
+    async def select_all_from(self, tables_obj, *args):
+        '''Helper'''
+        return await self.select_from(tables_obj, "*", *args)
+
+    async def count(self, tables_obj, *args):
+        '''Helper for selecting the count of rows from a given table'''
+        shards = self._read_shards(str(tables_obj), args)
+        counts = await asyncio.gather(*[shard.count(tables_obj, *args) for shard in shards])
+        return sum(counts)
+
+    async def aggregate(self, tables_obj, *args, group_by=None, sum=None, avg=None, min=None, max=None, count=None, having=None):
+        '''
+        Computes aggregates on every shard concurrently, then combines the partial results of each group.
+        having is only supported when the query is sent to a single shard.
+        See ManagerSQLite.aggregate() for the parameters and the returned rows.
+        '''
+        functions = {"sum": sum, "avg": avg, "min": min, "max": max, "count": count}
+        shards = self._read_shards(str(tables_obj), args)
+        if len(shards) == 1:
+            return await shards[0].aggregate(tables_obj, *args, group_by=group_by, having=having, **functions)
+        if having is not None:
+            raise ValueError("having is not supported by aggregates over several shards")
+
+        if group_by is None:
+            group_by = []
+        elif isinstance(group_by, str):
+            group_by = [group_by]
+        for function, columns in functions.items():
+            if columns is None or columns is False:
+                functions[function] = []
+            elif columns is True:
+                functions[function] = ["*"]
+            elif isinstance(columns, str):
+                functions[function] = [columns]
+            else: # a column asked twice would be merged twice
+                functions[function] = list(dict.fromkeys(columns))
+
+        # averages are rebuilt from the sum and the count of each shard
+        shard_functions = {
+            "sum": functions["sum"] + functions["avg"],
+            "min": functions["min"],
+            "max": functions["max"],
+            "count": functions["count"] + functions["avg"],
+        }
+        shard_functions = {function: list(dict.fromkeys(columns)) or None for function, columns in shard_functions.items()}
+        order, limit, rest = self._split_clauses(args)
+        results = await asyncio.gather(*[shard.aggregate(tables_obj, *rest, group_by=group_by, **shard_functions)
+            for shard in shards])
+
+        def alias(function, col):
+            return function if col == "*" else f"{function}_{col.replace('.', '_')}"
+
+        groups = {}
+        for result in results:
+            for row in result:
+                group = tuple(row[:len(group_by)])
+                partial = row._asdict()
+                if group not in groups:
+                    groups[group] = partial
+                    continue
+                merged = groups[group]
+                for function in ("sum", "count", "min", "max"):
+                    for col in shard_functions[function] or []:
+                        name = alias(function, col)
+                        current, other = merged[name], partial[name]
+                        if current is None or other is None: # groups without values aggregate to NULL
+                            merged[name] = other if current is None else current
+                        elif function in ("sum", "count"):
+                            merged[name] = current + other
+                        elif (other < current) == (function == "min"):
+                            merged[name] = other
+
+        fields = [col.split(".")[-1] for col in group_by]
+        for function, columns in functions.items():
+            fields += [alias(function, col) for col in columns]
+        row_class = namedtuple("Aggregate", fields, rename=True)
+        rows = []
+        for merged in groups.values():
+            values = list(merged.values())[:len(group_by)]
+            for function, columns in functions.items():
+                for col in columns:
+                    if function == "avg":
+                        total, amount = merged[alias("sum", col)], merged[alias("count", col)]
+                        values.append(total / amount if amount else None)
+                    else:
+                        values.append(merged[alias(function, col)])
+            rows.append(row_class(*values))
+        return self._merge([rows], order, limit)
+
+    ### DROP / DELETE ###
+
+    async def drop_table(self, tablename):
+        '''Delete a table from every shard'''
+        await asyncio.gather(*[shard.drop_table(tablename) for shard in self.shards])
+
+    async def drop_tables(self, *tables):
+        '''Helper to delete multiple tables'''
+        for t in tables:
+            await self.drop_table(t)
+
+    async def reset(self):
+        '''Erases all tables, but keeps the files'''
+        await self.drop_tables(*list(self.entities.keys()))
+
+    async def delete_table_contents(self, tablename):
+        '''Delete all contents within a table, on every shard'''
+        await asyncio.gather(*[shard.delete_table_contents(tablename) for shard in self.shards])
+
+    async def clear_contents(self):
+        '''Delete all database contents, preserving the schemas'''
+        for entity in self.entities.keys():
+            await self.delete_table_contents(entity)
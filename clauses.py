@@ -13,10 +13,15 @@ class Where:
     def __init__(self, compose=False, separator=" AND ", **kargs):
         self.sep = separator
         self.condstr = ""
+        self.values = {} # column=value equalities that every matching row satisfies
         if compose:
             cond_list = [wobj.condstr for wobj in kargs.values()]
             self.condstr = separator.join(cond_list)
+            if separator.strip().upper() == "AND":
+                for wobj in kargs.values():
+                    self.values.update(wobj.values)
         else:
+            self.values = dict(kargs)
             pairs = []
             for key, value in kargs.items():
                 if isinstance(value, str):
@@ -47,6 +52,22 @@ class Order_by:
     def __str__(self):
         return f"ORDER BY {self.col} {self.dir}"
 
+class Group_by:
+    '''GROUP BY clause from SQL represented as an object'''
+    def __init__(self, *col_names):
+        self.cols = col_names
+
+    def __str__(self):
+        return f"GROUP BY {', '.join(self.cols)}"
+
+class Having:
+    '''HAVING clause from SQL represented as an object, accepts a Where object or a condition string'''
+    def __init__(self, condition):
+        self.condstr = getattr(condition, "condstr", str(condition))
+
+    def __str__(self):
+        return f"HAVING {self.condstr}"
+
 class Join:
     '''JOIN clause from SQL represented as an object'''
     def __init__(self, table_A, table_B):
@@ -55,7 +76,7 @@ class Join:
         self.join_condition = ""
         for key in table_A.foreign_key:
             if key in table_B.primary_key:
-                self.join_condition += f"{table_A}.{key}={table_B}.{key}"
+                self.join_condition += f"{table_A.e_name}.{key}={table_B.e_name}.{key}"
                 break # only one condition for join
 
     def __str__(self):
@@ -63,6 +84,17 @@ class Join:
             return f"INNER JOIN {self.table_B.e_name} ON {self.join_condition}"
         return f"JOIN {self.table_B.e_name}"
 
+class Zeroblob:
+    '''
+    A BLOB of the given size filled with zeros, to be used as a value on insert()
+    The contents can then be streamed in with open_blob(), without holding them in memory
+    '''
+    def __init__(self, size):
+        self.size = int(size)
+
+    def __str__(self):
+        return f"zeroblob({self.size})"
+
 ## Statements -> separate on another file
 ## [insert, select, update, delete] are necessary for triggers
 
@@ -74,7 +106,10 @@ class Select_query:
     def __init__(self, tables_obj, cols_obj="*", *args):
         # I should perform some kind of type checking here, and throw an error if needed
         self.sql = f"SELECT {str(cols_obj)} FROM {str(tables_obj)}"
+        self.tables = [str(tables_obj)] # tables read by the query, used by materialized views
         for arg in args:
+            if isinstance(arg, Join):
+                self.tables.append(arg.table_B.e_name)
             self.sql += f" {str(arg)}" # whitespace is relevant here
 
     def __str__(self):
@@ -7,9 +7,15 @@ def ident(level):
     """Function to help with identation"""
     return "    " * level
 
+def _tuple_items(items):
+    """Function to join the items of a tuple, a single item still needs a trailing comma"""
+    if len(items) == 1:
+        return f"{items[0]},"
+    return ", ".join(items)
+
 def _init_header(filename, rewrite=False):
-    """Function to write an auto-generated indicator in the file header"""
-    if (not rewrite) and (not os.path.exists(filename)):
+    """Function to write an auto-generated indicator in the file header, rewrite discards the previous contents"""
+    if rewrite or (not os.path.exists(filename)):
         with open(filename, "w+") as f:
             f.write("\'\'\' This file is automatically generated. \'\'\'\n\n")
 
@@ -20,6 +26,12 @@ class Entity:
         self.args_dict = args_dict
         self.primary_key = []
         self.foreign_key = {}
+        self.view_query = None # only set for materialized views
+        self.view_sources = [] # tables read by view_query
+        self.shard_key = None # (column, ranges), only set for sharded tables
+        self.hashable = False
+        self.fulltext = None # (columns, tokenizer), only set for full-text searchable tables
+        self.deferred = [] # columns left out of default selects
         # todo: pass file_path here 
     
     # WRITE to file operation is split into several small methods (abstraction)
@@ -48,6 +60,10 @@ class Entity:
     def _write_attrs(self, file_obj):
         self._write_dict(file_obj,"_attribute_types", self.args_dict)
 
+    def _write_slots(self, file_obj):
+        slots = _tuple_items([f"\"{key}\"" for key in self.args_dict.keys()] + ["\"_loader\"", "\"__weakref__\""])
+        file_obj.write(f"{ident(1)}__slots__ = ({slots})\n\n")
+
     def _write_PK(self, file_obj):
         pk_list_str = "\", \"".join(self.primary_key)
         file_obj.write(f"{ident(1)}_primary_key = [\"{pk_list_str}\"]\n\n")
@@ -55,12 +71,43 @@ class Entity:
     def _write_FK(self, file_obj):
         self._write_dict(file_obj,"_foreign_key", self.foreign_key)
 
+    def _write_view_query(self, file_obj):
+        file_obj.write(f"{ident(1)}_view_query = {self.view_query!r}\n\n")
+        file_obj.write(f"{ident(1)}_view_sources = {self.view_sources!r}\n\n")
+
+    def _write_shard_key(self, file_obj):
+        file_obj.write(f"{ident(1)}_shard_key = {self.shard_key!r}\n\n")
+
+    def _write_fulltext(self, file_obj):
+        file_obj.write(f"{ident(1)}_fulltext = {self.fulltext!r}\n\n")
+
+    def _write_deferred(self, file_obj):
+        deferred = _tuple_items([f"\"{col}\"" for col in self.deferred])
+        file_obj.write(f"{ident(1)}_deferred = ({deferred})\n\n")
+
     def _write_constructor(self, file_obj):
         file_obj.write(ident(1) + "def __init__(self, **kargs):\n")
         for key, value in self.args_dict.items():
             file_obj.write(ident(2) + f"self.{key} = kargs[\"{key}\"]\n")
         file_obj.write("\n")
 
+    def _write_from_row(self, file_obj):
+        file_obj.write(ident(1) + "@classmethod\n")
+        file_obj.write(ident(1) + "def _from_row(cls, row):\n")
+        file_obj.write(ident(2) + "obj = cls.__new__(cls)\n")
+        targets = _tuple_items([f"obj.{key}" for key in self.args_dict.keys()])
+        file_obj.write(ident(2) + f"{targets} = row\n")
+        file_obj.write(ident(2) + "return obj\n")
+        file_obj.write("\n")
+
+    def _write_getattr(self, file_obj):
+        # only called for columns that were not selected, they are loaded on first access
+        file_obj.write(ident(1) + "def __getattr__(self, name):\n")
+        file_obj.write(ident(2) + "if name not in self._attribute_types:\n")
+        file_obj.write(ident(3) + "raise AttributeError(name)\n")
+        file_obj.write(ident(2) + "return self._loader(self, name)\n")
+        file_obj.write("\n")
+
     def _write_equals(self, file_obj):
         file_obj.write(ident(1) + "def __eq__(self, other):\n")
         file_obj.write(ident(2) + f"if type(other).__name__ != \"{self.e_name}\":\n")
@@ -71,6 +118,12 @@ class Entity:
         file_obj.write(ident(2) + f"return True\n")
         file_obj.write("\n")
 
+    def _write_hash(self, file_obj):
+        pk_tuple = _tuple_items([f"self.{pk}" for pk in self.primary_key])
+        file_obj.write(ident(1) + "def __hash__(self):\n")
+        file_obj.write(ident(2) + f"return hash(({pk_tuple}))\n")
+        file_obj.write("\n")
+
     def writedown(self, file_path="", filename=None, rewrite=False):
         """method to actually write the entity object model in the corresponding file"""
         if filename is None:
@@ -83,11 +136,24 @@ class Entity:
         with open(filename, "a") as obj_file:
             self._write_name(obj_file)
             self._write_attrs(obj_file)
+            self._write_slots(obj_file)
             self._write_PK(obj_file)
             if self.foreign_key:
                 self._write_FK(obj_file)
+            if self.view_query is not None:
+                self._write_view_query(obj_file)
+            if self.shard_key is not None:
+                self._write_shard_key(obj_file)
+            if self.fulltext is not None:
+                self._write_fulltext(obj_file)
+            if self.deferred:
+                self._write_deferred(obj_file)
             self._write_constructor(obj_file)
+            self._write_from_row(obj_file)
+            self._write_getattr(obj_file)
             self._write_equals(obj_file)
+            if self.hashable:
+                self._write_hash(obj_file)
 
     def joined_primary_key(self, pk=None):
         '''helper to join the primary key in case of composite key'''
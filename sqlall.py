@@ -7,6 +7,7 @@ Current Version: 0.6 (under development)
 import aiosqlite
 import os
 from Managers.manager_factory import ManagerFactory
+from Managers.sharded_manager import ShardedManager
 
 class sqlall:
     '''
@@ -35,10 +36,11 @@ class sqlall:
             os.mkdir(dbpath)
         if sqlall._manager_instances is None:
             sqlall._manager_instances = dict()
-        if dbtype not in sqlall._manager_instances:
-            sqlall._manager_instances[dbtype] = ManagerFactory.load_manager(sqlall._database_location(dbname, dbpath), dbtype, dbpath)
-            sqlall._manager_instances[dbtype].load_entities()
-        return sqlall._manager_instances[dbtype]
+        key = (dbtype, sqlall._database_location(dbname, dbpath))
+        if key not in sqlall._manager_instances:
+            sqlall._manager_instances[key] = ManagerFactory.load_manager(sqlall._database_location(dbname, dbpath), dbtype, dbpath)
+            sqlall._manager_instances[key].load_entities()
+        return sqlall._manager_instances[key]
 
     @staticmethod
     async def _get_instance_async(dbname, dbtype, dbpath): # change implementation to call factory instead
@@ -47,10 +49,11 @@ class sqlall:
             os.mkdir(dbpath)
         if sqlall._manager_instances is None:
             sqlall._manager_instances = dict()
-        if dbtype not in sqlall._manager_instances:
-            sqlall._manager_instances[dbtype] = await ManagerFactory.load_manager_async(sqlall._database_location(dbname, dbpath), dbtype, dbpath)
-            await sqlall._manager_instances[dbtype].load_entities()
-        return sqlall._manager_instances[dbtype]
+        key = (dbtype, sqlall._database_location(dbname, dbpath))
+        if key not in sqlall._manager_instances:
+            sqlall._manager_instances[key] = await ManagerFactory.load_manager_async(sqlall._database_location(dbname, dbpath), dbtype, dbpath)
+            await sqlall._manager_instances[key].load_entities()
+        return sqlall._manager_instances[key]
 
     @classmethod
     def manager(cls, dbname='database.db', dbtype="SQLite", dbpath="resources/"):
@@ -62,6 +65,27 @@ class sqlall:
         '''Get the single database manager instance (use this)'''
         return await cls._get_instance_async(dbname, dbtype, dbpath)
 
+    @staticmethod
+    def _shard_names(shards, dbname='database.db'):
+        '''names of the database files used by each shard, e.g. database_0.db, database_1.db'''
+        name, extension = os.path.splitext(dbname)
+        return [f"{name}_{index}{extension}" for index in range(shards)]
+
+    @classmethod
+    async def sharded_manager_async(cls, shards, dbname='database.db', dbtype="SQLite", dbpath="resources/"):
+        '''
+        Get a manager that partitions tables across the given number of database files.
+        The number of shards must not change once data has been inserted.
+        '''
+        managers = [await cls._get_instance_async(name, dbtype, dbpath) for name in cls._shard_names(shards, dbname)]
+        return ShardedManager(managers, dbpath)
+
+    @staticmethod
+    def clear_sharded_database(shards, dbname='database.db', dbpath="resources/"):
+        '''Destroy the database files of every shard, if they exist.'''
+        for name in sqlall._shard_names(shards, dbname):
+            sqlall.clear_database(name, dbpath)
+
     # to be tested -> manager specific functionality!!
     @staticmethod
     async def compress_database_into(dbnewname, dbname='database.db', dbpath="resources/"):
@@ -71,7 +95,9 @@ class sqlall:
         for the new file after this operation is performed
         As a suggestion, your implementation may want to iterate over a number in the/
         dbname parameter, to use as reference for version control
+        This blocks the database during the whole copy, see manager.backup_to() for a non-blocking/
+        alternative and manager.incremental_vacuum() to shrink the file in place
         '''
         connection = await aiosqlite.connect(sqlall._database_location(dbname, dbpath))
-        await connection.execute(f"VACUUM INTO {dbnewname}") # verificar a path
+        await connection.execute("VACUUM INTO ?", (sqlall._database_location(dbnewname, dbpath),))
         await connection.close()
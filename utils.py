@@ -23,6 +23,14 @@ class utils:
     def limit(number):
         return Limit(number)
 
+    @staticmethod
+    def group_by(*column_names):
+        return Group_by(*column_names)
+
+    @staticmethod
+    def having(condition):
+        return Having(condition)
+
     @staticmethod
     def select_query(tables_obj, cols_obj="*", *args):
         return Select_query(tables_obj, cols_obj, *args)
@@ -31,6 +39,10 @@ class utils:
     def join(table_A, table_B):
         return Join(table_A, table_B)
 
+    @staticmethod
+    def zeroblob(size):
+        return Zeroblob(size)
+
     @staticmethod
     def load_module(module_name, module_path, piece=None):
         '''Function to import modules dinamically'''